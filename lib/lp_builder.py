@@ -1,12 +1,24 @@
 import logging
+import os
 from pathlib import Path
-from typing import List, Optional, Dict, Any
+import pickle
+import tempfile
+from typing import List, Optional, Dict, Any, Iterator, Tuple
 import yaml
 
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader  # type: ignore
+
 CUR_DIR = Path(__file__).parent.resolve()
 PARENT_DIR = Path(__file__).parent.parent.resolve()
 LP_DIR = PARENT_DIR / 'lp-builder-config'
 assert LP_DIR.is_dir(), f"{LP_DIR} doesn't seem to exist?"
+LP_CONFIG_CACHE = CUR_DIR / '.lp_config_cache.pickle'
+# Bump this if the layout of the cache or the parsing of the config files
+# changes, so that a cache from another version of this module is ignored.
+LP_CONFIG_CACHE_VERSION = 1
 
 """Understanding the various configs.
 
@@ -84,6 +96,10 @@ LpConfig = Dict[str, Dict[str, List[str]]]
 YamlConfig = Dict[str, LpConfig]
 # a mapping of section -> the raw config
 RawConfig = Dict[str, Dict[str, Any]]
+# the (path, mtime_ns, size) of a config file, used to validate the cache
+CacheKey = Tuple[str, int, int]
+# a mapping of config file path -> (cache key, parsed config)
+LpConfigCache = Dict[str, Tuple[CacheKey, LpConfig]]
 
 logger = logging.getLogger(__name__)
 
@@ -274,18 +290,98 @@ def get_lp_builder_config() -> LpConfig:
 
     {<charm-name>: {<branch-name>: [track/channel, ...]}}
 
+    The parsed configs are cached in `LP_CONFIG_CACHE` between runs, and a
+    file is only re-parsed if its mtime or size has changed.
+
     :returns: The charm <-> branch <-> track/channel mapping.
     """
     global _LP_CONFIG
     if _LP_CONFIG is not None:
         return _LP_CONFIG.copy()
+    cache = _read_lp_config_cache()
+    config_files: List[Tuple[Path, CacheKey]] = []
+    with os.scandir(LP_DIR) as it:
+        for entry in it:
+            if entry.name.endswith('.yaml') and entry.is_file():
+                stat = entry.stat()
+                config_files.append(
+                    (Path(entry.path),
+                     (entry.path, stat.st_mtime_ns, stat.st_size)))
+    new_cache: LpConfigCache = {}
     lp_config = {}
-    for config_file in LP_DIR.glob('*.yaml'):
-        lp_config.update(parse_lp_builder_config_file(config_file))
+    for config_file, key in config_files:
+        cached = cache.get(key[0])
+        if cached is not None and cached[0] == key:
+            file_config = cached[1]
+            _YAML_CONFIG[config_file.stem] = file_config
+        else:
+            file_config = parse_lp_builder_config_file(config_file)
+        new_cache[key[0]] = (key, file_config)
+        lp_config.update(file_config)
+    if new_cache != cache:
+        _write_lp_config_cache(new_cache)
     _LP_CONFIG = lp_config
     return lp_config.copy()
 
 
+def _read_lp_config_cache() -> LpConfigCache:
+    """Read the parsed lp builder configs cached from a previous run.
+
+    The file is {'version': LP_CONFIG_CACHE_VERSION, 'files': cache}; any
+    other version or an unexpected shape is treated as an empty cache.
+
+    :returns: the cache, or an empty dict if it can't be read.
+    """
+    try:
+        with open(LP_CONFIG_CACHE, 'rb') as f:
+            data = pickle.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        logging.warning("Ignoring unreadable cache %s due to: %s",
+                        LP_CONFIG_CACHE, str(e))
+        return {}
+    try:
+        if data['version'] != LP_CONFIG_CACHE_VERSION:
+            return {}
+        cache = data['files']
+        for path, (key, file_config) in cache.items():
+            if not (isinstance(key, tuple) and len(key) == 3 and
+                    key[0] == path and isinstance(file_config, dict)):
+                return {}
+    except Exception:
+        return {}
+    return cache
+
+
+def _write_lp_config_cache(cache: LpConfigCache) -> None:
+    """Atomically write the parsed lp builder configs to the cache file.
+
+    Failing to write the cache is not an error; it'll be rebuilt next time.
+
+    :param cache: the cache to write.
+    """
+    data = {'version': LP_CONFIG_CACHE_VERSION, 'files': cache}
+    try:
+        fd, tmp_name = tempfile.mkstemp(dir=LP_CONFIG_CACHE.parent,
+                                        prefix=LP_CONFIG_CACHE.name)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+            # mkstemp creates the file as 0600; give it the normal mode so
+            # that other users of a shared checkout can read it.
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(tmp_name, 0o666 & ~umask)
+            os.replace(tmp_name, LP_CONFIG_CACHE)
+        except Exception:
+            os.unlink(tmp_name)
+            raise
+    except Exception as e:
+        logging.warning("Couldn't write cache %s due to: %s",
+                        LP_CONFIG_CACHE, str(e))
+
+
 def sections() -> List[str]:
     """Return the section names available.
 
@@ -336,6 +432,11 @@ def get_yaml_config() -> RawConfig:
 def parse_lp_builder_config_file(config_file: Path) -> LpConfig:
     """Parse an lp builder config file into an LpConfig structure.
 
+    Only the branches and charmhub names are needed, so the file is first
+    parsed as a stream of events, skipping the rest of the document.  If the
+    file has a structure that the event parser doesn't handle, then it falls
+    back to loading the whole document.
+
     :param config_file: the file to read.
     """
     global _YAML_CONFIG
@@ -345,8 +446,25 @@ def parse_lp_builder_config_file(config_file: Path) -> LpConfig:
     except KeyError:
         pass
     try:
-        with open(config_file) as f:
-            raw_config = yaml.safe_load(f)
+        with open(config_file, 'rb') as f:
+            lp_config = _parse_lp_builder_config_events(
+                yaml.parse(f, Loader=SafeLoader))
+    except Exception as e:
+        logging.debug("Falling back to full load of config_file: %s due to: "
+                      "%s", config_file, str(e))
+        lp_config = _load_lp_builder_config_file(config_file)
+    _YAML_CONFIG[name] = lp_config
+    return lp_config
+
+
+def _load_lp_builder_config_file(config_file: Path) -> LpConfig:
+    """Load the whole of an lp builder config file into an LpConfig.
+
+    :param config_file: the file to read.
+    """
+    try:
+        with open(config_file, 'rb') as f:
+            raw_config = yaml.load(f, Loader=SafeLoader)
     except Exception as e:
         logging.error("Couldn't read config_file: %s due to: %s",
                       config_file, str(e))
@@ -373,5 +491,176 @@ def parse_lp_builder_config_file(config_file: Path) -> LpConfig:
     except KeyError:
         # just ignore the file if there are no projects
         logging.warning('File %s contains no projects key?', config_file)
-    _YAML_CONFIG[name] = lp_config
     return lp_config
+
+
+class UnexpectedConfigEvent(Exception):
+    """The event parser found a structure it doesn't handle."""
+
+
+# used to check that plain scalars are strings when parsing events.
+_RESOLVER = yaml.resolver.Resolver()
+_STR_TAG = 'tag:yaml.org,2002:str'
+
+
+def _parse_lp_builder_config_events(events: Iterator[Any]) -> LpConfig:
+    """Parse the events of an lp builder config file into an LpConfig.
+
+    Only `defaults.branches` and the `charmhub` and `branches` of the
+    `projects` are built; everything else is skipped.  This only handles the
+    happy path: anything else (missing keys, non-string values, aliases into
+    the parts that are used, merge keys, etc.) raises UnexpectedConfigEvent so
+    that the caller can fall back to loading the whole document.
+
+    :param events: the events from yaml.parse()
+    :raises: UnexpectedConfigEvent if the structure isn't as expected.
+    """
+    _expect(next(events), yaml.StreamStartEvent)
+    _expect(next(events), yaml.DocumentStartEvent)
+    _expect(next(events), yaml.MappingStartEvent)
+    default_branches: Dict[str, List[str]] = {}
+    projects: Optional[List[Tuple[str, Optional[Dict[str, List[str]]]]]] = \
+        None
+    for key, event in _mapping_items(events):
+        if key == 'defaults':
+            _expect(event, yaml.MappingStartEvent)
+            default_branches = {}
+            for _key, _event in _mapping_items(events):
+                if _key == 'branches':
+                    default_branches = _parse_branches_events(events, _event)
+                else:
+                    _skip_node_events(events, _event)
+        elif key == 'projects':
+            _expect(event, yaml.SequenceStartEvent)
+            projects = []
+            for event in _sequence_items(events):
+                _expect(event, yaml.MappingStartEvent)
+                charmhub: Optional[str] = None
+                branches: Optional[Dict[str, List[str]]] = None
+                for _key, _event in _mapping_items(events):
+                    if _key == 'charmhub':
+                        charmhub = _scalar_str(_event)
+                    elif _key == 'branches':
+                        branches = _parse_branches_events(events, _event)
+                    else:
+                        _skip_node_events(events, _event)
+                if charmhub is None:
+                    raise UnexpectedConfigEvent("project without charmhub")
+                projects.append((charmhub, branches))
+        else:
+            _skip_node_events(events, event)
+    _expect(next(events), yaml.DocumentEndEvent)
+    _expect(next(events), yaml.StreamEndEvent)
+    if projects is None:
+        raise UnexpectedConfigEvent("no projects key")
+    lp_config: LpConfig = {}
+    for charmhub, branches in projects:
+        if branches is None:
+            branches = default_branches.copy()
+        lp_config[charmhub] = branches
+    return lp_config
+
+
+def _parse_branches_events(events: Iterator[Any],
+                           event: Any,
+                           ) -> Dict[str, List[str]]:
+    """Parse a branches mapping into {<branch-name>: [track/channel, ...]}.
+
+    :param events: the events from yaml.parse()
+    :param event: the first event of the branches node.
+    :raises: UnexpectedConfigEvent if the structure isn't as expected.
+    """
+    _expect(event, yaml.MappingStartEvent)
+    branches: Dict[str, List[str]] = {}
+    for branch, event in _mapping_items(events):
+        _expect(event, yaml.MappingStartEvent)
+        channels: Optional[List[str]] = None
+        for key, _event in _mapping_items(events):
+            if key == 'channels':
+                _expect(_event, yaml.SequenceStartEvent)
+                channels = [_scalar_str(e) for e in _sequence_items(events)]
+            else:
+                _skip_node_events(events, _event)
+        if channels is None:
+            raise UnexpectedConfigEvent(f"branch {branch} without channels")
+        branches[branch] = channels
+    return branches
+
+
+def _mapping_items(events: Iterator[Any]) -> Iterator[Tuple[str, Any]]:
+    """Yield the (key, first value event) pairs of a mapping.
+
+    The MappingStartEvent must already have been consumed, and the caller
+    must consume the whole of each value node before getting the next pair.
+
+    :param events: the events from yaml.parse()
+    :raises: UnexpectedConfigEvent if a key isn't a string (including merge
+        keys).
+    """
+    while True:
+        event = next(events)
+        if isinstance(event, yaml.MappingEndEvent):
+            return
+        yield _scalar_str(event), next(events)
+
+
+def _sequence_items(events: Iterator[Any]) -> Iterator[Any]:
+    """Yield the first event of each item of a sequence.
+
+    The SequenceStartEvent must already have been consumed, and the caller
+    must consume the whole of each item before getting the next one.
+
+    :param events: the events from yaml.parse()
+    """
+    while True:
+        event = next(events)
+        if isinstance(event, yaml.SequenceEndEvent):
+            return
+        yield event
+
+
+def _skip_node_events(events: Iterator[Any], event: Any) -> None:
+    """Consume the rest of the node started by :param:`event`.
+
+    :param events: the events from yaml.parse()
+    :param event: the first event of the node to skip.
+    """
+    if not isinstance(event, yaml.CollectionStartEvent):
+        return
+    depth = 1
+    while depth:
+        event = next(events)
+        if isinstance(event, yaml.CollectionStartEvent):
+            depth += 1
+        elif isinstance(event, yaml.CollectionEndEvent):
+            depth -= 1
+
+
+def _scalar_str(event: Any) -> str:
+    """Return the value of a scalar event that safe_load would make a str.
+
+    :param event: the event to check.
+    :raises: UnexpectedConfigEvent if it's not a string scalar.
+    """
+    _expect(event, yaml.ScalarEvent)
+    if event.tag is not None:
+        raise UnexpectedConfigEvent(f"tagged scalar {event.value}")
+    if event.implicit[0]:
+        tag = _RESOLVER.resolve(yaml.ScalarNode, event.value, (True, False))
+    else:
+        tag = _STR_TAG
+    if tag != _STR_TAG:
+        raise UnexpectedConfigEvent(f"non-string scalar {event.value}")
+    return event.value
+
+
+def _expect(event: Any, event_type: type) -> None:
+    """Check the event is of the expected type.
+
+    :param event: the event to check.
+    :param event_type: the expected type of the event.
+    :raises: UnexpectedConfigEvent if it's not.
+    """
+    if not isinstance(event, event_type):
+        raise UnexpectedConfigEvent(
+            f"expected {event_type.__name__}, got {event}")